@@ -1,10 +1,26 @@
 import os
+import math
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # 純輸出圖檔，指定非互動後端，省掉後端偵測
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.font_manager as fm
-import math
+
+# pyarrow 的 CSV 讀取器是多執行緒的，比 pandas 預設 C 引擎快數倍，
+# 而且 concat_tables 可以零拷貝合併多個檔案；未安裝時退回 pandas 讀取
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# 四個數值量測欄位（順序即繪圖子圖的順序）與各自的基準線（mg/L）
+NUMERIC_COLS = ("懸浮固體", "氨氮", "生化需氧量", "總磷")
+BASELINES = {"懸浮固體": 50, "氨氮": 0.1, "生化需氧量": 1, "總磷": 25}
 
 def load_csv_files(folder_path):
     """讀取當前目錄下所有 CSV 檔案"""
@@ -12,102 +28,114 @@ def load_csv_files(folder_path):
 
 def clean_and_merge_data(csv_files, folder_path):
     """讀取並合併所有 CSV 檔案的數據"""
-    required_cols = ["採樣時間", "懸浮固體", "氨氮", "生化需氧量", "總磷"]
-    all_data = []
-
-    for file in csv_files:
-        file_path = os.path.join(folder_path, file)
-        df = pd.read_csv(file_path)
-        if all(col in df.columns for col in required_cols):
-            df["來源檔案"] = file  
+    required_cols = ["採樣時間", *NUMERIC_COLS]
+    # 明確指定數值欄位型別，省掉讀取器的型別推斷與事後的 to_numeric 轉換
+    dtypes = {col: "float64" for col in NUMERIC_COLS}
+    if pa is not None:
+        # 直接用 pyarrow 讀取每個檔案，合併時 concat_tables 只串接
+        # chunk 而不搬動資料，最後才一次轉成 pandas
+        # 採樣時間固定讀成字串：各檔案可能混用「只有日期」與「完整時間」
+        # 兩種格式，放任型別推斷會讓 concat_tables 因 schema 不一致而失敗；
+        # 反正合併後馬上會交給 pd.to_datetime 解析
+        convert_options = pacsv.ConvertOptions(
+            include_columns=required_cols,
+            column_types={"採樣時間": pa.string(),
+                          **{col: pa.float64() for col in dtypes}})
+        tables = []
+        for file in csv_files:
+            file_path = os.path.join(folder_path, file)
+            try:
+                table = pacsv.read_csv(file_path, convert_options=convert_options)
+            except (pa.ArrowInvalid, pa.ArrowKeyError):
+                print(f"⚠️ 檔案 {file} 缺少必要欄位或數值格式錯誤，已跳過！")
+                continue
+            # 型別固定為字串：零列的檔案（只有表頭）會讓 pa.array([])
+            # 推斷成 null 型別，concat_tables 就會因 schema 不一致而失敗
+            tables.append(table.append_column(
+                "來源檔案", pa.array([file] * len(table), type=pa.string())))
+
+        if not tables:
+            return None
+
+        df_all = pa.concat_tables(tables).to_pandas()
+    else:
+        all_data = []
+        for file in csv_files:
+            file_path = os.path.join(folder_path, file)
+            try:
+                # usecols 讓讀取器在解析階段就略過不需要的欄位
+                df = pd.read_csv(file_path, usecols=required_cols, dtype=dtypes)
+            except (ValueError, KeyError):
+                print(f"⚠️ 檔案 {file} 缺少必要欄位或數值格式錯誤，已跳過！")
+                continue
+            df["來源檔案"] = file
             all_data.append(df[required_cols + ["來源檔案"]])
-        else:
-            print(f"⚠️ 檔案 {file} 缺少必要欄位，已跳過！")
 
-    if not all_data:
-        return None
+        if not all_data:
+            return None
 
-    df_all = pd.concat(all_data, ignore_index=True)
-    df_all["採樣時間"] = pd.to_datetime(df_all["採樣時間"], errors="coerce")
+        df_all = pd.concat(all_data, ignore_index=True)
+    # 同一天常有多站採樣，cache=True 讓重複的時間字串只解析一次；
+    # format="mixed" 逐值推斷格式，各檔案混用「只有日期」與
+    # 「完整時間」時才不會整批被 coerce 成 NaT 而遭 dropna 丟棄
+    df_all["採樣時間"] = pd.to_datetime(df_all["採樣時間"], format="mixed",
+                                    errors="coerce", cache=True)
     df_all = df_all.dropna(subset=["採樣時間"])
-    df_all = df_all.sort_values(by="採樣時間")
-
-    for col in ["懸浮固體", "氨氮", "生化需氧量", "總磷"]:
-        df_all[col] = pd.to_numeric(df_all[col], errors="coerce")
+    # 以採樣時間作為索引並排序一次，之後的分組切片都維持已排序狀態
+    df_all = df_all.set_index("採樣時間").sort_index()
 
     return df_all
 
-def nice_num(x):
-    """計算較為『好看』的刻度間隔"""
-    exponent = math.floor(math.log10(x))
-    fraction = x / (10 ** exponent)
-    if fraction < 1.5:
-        nice_fraction = 1
-    elif fraction < 3:
-        nice_fraction = 2
-    elif fraction < 7:
-        nice_fraction = 5
-    else:
-        nice_fraction = 10
-    return nice_fraction * (10 ** exponent)
+def nice_num_vec(x):
+    """計算較為『好看』的刻度間隔（向量化版本，一次處理整個陣列）"""
+    x = np.asarray(x, dtype=float)
+    exponent = np.floor(np.log10(x))
+    fraction = x / 10.0 ** exponent
+    nice_fraction = np.where(fraction < 1.5, 1,
+                    np.where(fraction < 3, 2,
+                    np.where(fraction < 7, 5, 10)))
+    return nice_fraction * 10.0 ** exponent
 
 def calculate_max_values(df_all):
     """
     計算所有地點中，每個檢測物的最大值，
     並以該最大值乘以 1.05 作為各參數的基準上限
     """
-    max_values = {}
-    for param in ["懸浮固體", "氨氮", "生化需氧量", "總磷"]:
-        raw_max = df_all[param].max(skipna=True)
-        if pd.isna(raw_max) or raw_max <= 0:
-            raw_max = 1
-        max_values[param] = raw_max * 1.05
-    return max_values
-
-def generate_plots_for_file(df_all, folder_path, file_name, max_values):
-    """針對每個 CSV 檔案生成獨立的水質變化圖，並統一 Y 軸上限"""
-    if df_all is None or df_all.empty:
-        print("❌ 沒有可用的數據來生成圖表！")
+    # 一次對四個欄位取最大值，只掃描數據一遍
+    raw_max = df_all[list(NUMERIC_COLS)].max(skipna=True)
+    raw_max = raw_max.where(raw_max > 0, 1).fillna(1)
+    return (raw_max * 1.05).to_dict()
+
+def generate_plots_for_file(fig, axs, group, folder_path, file_name, max_values, tick_intervals, min_year, max_year):
+    """針對單一 CSV 檔案的數據生成水質變化圖，並統一 X/Y 軸範圍"""
+    if group is None or group.empty:
+        print(f"❌ 檔案 {file_name} 沒有可用的數據來生成圖表！")
         return
-    
-    min_year = df_all["採樣時間"].dt.year.min()
-    max_year = df_all["採樣時間"].dt.year.max()
-
-    parameters = [
-        ("懸浮固體", "懸浮固體", 50),
-        ("氨氮", "氨氮", 0.1),
-        ("生化需氧量", "生化需氧量", 1),
-        ("總磷", "總磷", 25)
-    ]
-
-    fig, axs = plt.subplots(2, 2, figsize=(16, 12))
-    axs = axs.flatten()
 
-    for i, (param, title, baseline) in enumerate(parameters):
+    for i, param in enumerate(NUMERIC_COLS):
+        title = param
+        baseline = BASELINES[param]
         ax = axs[i]
+        ax.clear()  # 重複使用同一組子圖，只清掉上一個檔案畫的內容
         has_scatter_label = False
 
-        group = df_all[df_all["來源檔案"] == file_name].copy()  # **這裡加上 copy()**
-        if group.empty:
-            continue
+        # **缺值不再線性補值：改用遮罩陣列，matplotlib 會自動跳過缺值段**
+        x = group.index.to_numpy()
+        y = np.ma.masked_invalid(group[param].to_numpy())
 
-        # **線性補值，確保折線不會斷裂**
-        group[param] = group[param].interpolate(method="linear")
+        # 畫折線圖（採樣時間已是排序好的索引）
+        ax.plot(x, y, marker="o", markersize=4, linestyle="-", label=file_name)
 
-        # 畫折線圖
-        ax.plot(group["採樣時間"], group[param], marker="o", markersize=4, linestyle="-", label=file_name)
-        
-        # **只標記真實超標點，不補值**
+        # **只標記真實超標點（與折線共用同一份緩衝區）**
         if baseline is not None:
-            over_mask = group[param] > baseline
+            over_mask = (y > baseline).filled(False)
             if over_mask.any():
-                over_points = group.loc[over_mask, ["採樣時間", param]].dropna()  
-                if not has_scatter_label and not over_points.empty:
-                    ax.scatter(over_points["採樣時間"], over_points[param],
+                if not has_scatter_label:
+                    ax.scatter(x[over_mask], y[over_mask],
                                color="orange", s=40, zorder=5, label="超過基準線")
                     has_scatter_label = True
-                elif not over_points.empty:
-                    ax.scatter(over_points["採樣時間"], over_points[param],
+                else:
+                    ax.scatter(x[over_mask], y[over_mask],
                                color="orange", s=40, zorder=5)
 
         # 畫基準線
@@ -122,7 +150,7 @@ def generate_plots_for_file(df_all, folder_path, file_name, max_values):
 
         # 根據所有地點的最大值(乘以1.05)計算 Y 軸上限與刻度
         raw_max = max_values[param]
-        tick_interval = nice_num(raw_max / 5)
+        tick_interval = tick_intervals[param]
         y_limit = math.ceil(raw_max / tick_interval) * tick_interval
         ticks = np.arange(0, y_limit + tick_interval, tick_interval)
 
@@ -135,30 +163,72 @@ def generate_plots_for_file(df_all, folder_path, file_name, max_values):
         ax.legend()
         ax.grid(True)
 
-    plt.tight_layout()
-
     img_folder = os.path.join(folder_path, "img")
     os.makedirs(img_folder, exist_ok=True)
     img_path = os.path.join(img_folder, f"{file_name}_water_quality_trends.png")
-    plt.savefig(img_path, dpi=300, bbox_inches="tight")
+    # 版面在建立 Figure 時已調整好，不用 bbox_inches="tight" 的二次渲染
+    fig.savefig(img_path, dpi=200)
     print(f"✅ 圖片已儲存至 {img_path}")
-    plt.close(fig)
 
 
-if __name__ == "__main__":
-    folder_path = os.getcwd()  
+def setup_matplotlib(folder_path):
+    """設定中文字體與線條簡化參數（主程式與每個工作行程都要呼叫）"""
     font_path = os.path.join(folder_path, "STHeiti Medium.ttc")
-    
     if os.path.exists(font_path):
-        plt.rcParams["font.family"] = fm.FontProperties(fname=font_path).get_name()
+        # 直接把字體檔註冊進 fontManager，之後文字渲染不用再走
+        # 字體家族回退搜尋
+        fm.fontManager.addfont(font_path)
+        plt.rcParams["font.sans-serif"] = [fm.FontProperties(fname=font_path).get_name()]
+        plt.rcParams["axes.unicode_minus"] = False
     else:
         print("⚠️ 找不到 STHeiti Medium.ttc，將使用預設字體！")
+    plt.rcParams["path.simplify"] = True
+    plt.rcParams["path.simplify_threshold"] = 1.0
+
+
+# 每個工作行程各自建立一次、之後重複使用的 Figure
+_worker_fig = None
+_worker_axs = None
+
+def _init_plot_worker(folder_path):
+    """工作行程初始化：準備好共用的 Figure（後端已在模組載入時設為 Agg）"""
+    global _worker_fig, _worker_axs
+    setup_matplotlib(folder_path)
+    _worker_fig, _worker_axs = plt.subplots(2, 2, figsize=(16, 12))
+    # 版面固定一次，取代每次存檔前的 tight_layout / tight bbox 重新渲染
+    _worker_fig.subplots_adjust(left=0.06, right=0.98, top=0.95,
+                                bottom=0.08, hspace=0.3, wspace=0.2)
+    _worker_axs = _worker_axs.flatten()
+
+def _render_file(args):
+    group, folder_path, file_name, max_values, tick_intervals, min_year, max_year = args
+    generate_plots_for_file(_worker_fig, _worker_axs, group, folder_path, file_name,
+                            max_values, tick_intervals, min_year, max_year)
+
+
+if __name__ == "__main__":
+    folder_path = os.getcwd()
+    setup_matplotlib(folder_path)
 
     csv_files = load_csv_files(folder_path)
-    
+
     if csv_files:
         df_all = clean_and_merge_data(csv_files, folder_path)
         if df_all is not None:
             max_values = calculate_max_values(df_all)
-            for file_name in csv_files:
-                generate_plots_for_file(df_all, folder_path, file_name, max_values)
+            # 四個參數的刻度間隔一次算完
+            params = list(max_values)
+            intervals = nice_num_vec([max_values[p] / 5 for p in params])
+            tick_intervals = dict(zip(params, intervals))
+            min_year = df_all.index.year.min()
+            max_year = df_all.index.year.max()
+            # 先用 groupby 一次切好每個檔案的子資料，
+            # 避免每張圖都對整份資料做布林掃描
+            groups = dict(tuple(df_all.groupby("來源檔案", sort=False)))
+            # 每個檔案的圖彼此獨立，用行程池讓多核心同時渲染
+            tasks = [(group, folder_path, file_name, max_values,
+                      tick_intervals, min_year, max_year)
+                     for file_name, group in groups.items()]
+            with ProcessPoolExecutor(initializer=_init_plot_worker,
+                                     initargs=(folder_path,)) as executor:
+                list(executor.map(_render_file, tasks))
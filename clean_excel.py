@@ -1,76 +1,176 @@
 import pandas as pd
+import numpy as np
 import re
 import os
 import traceback
 
+# numba 可將純數字字串的解析編譯成機器碼，讓最常見的「乾淨數值」
+# 在進入正規表示式規則前就被處理掉；未安裝時 clean_series 跳過此捷徑
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def _parse_plain(value):
+        """解析只含數字與一個小數點的字串，其他內容一律回傳 NaN"""
+        mantissa = 0
+        decimals = 0
+        seen_dot = False
+        seen_digit = False
+        for c in value:
+            if c == '.':
+                if seen_dot:
+                    return np.nan
+                seen_dot = True
+            elif '0' <= c <= '9':
+                mantissa = mantissa * 10 + (ord(c) - 48)
+                seen_digit = True
+                if seen_dot:
+                    decimals += 1
+            else:
+                return np.nan
+        if not seen_digit:
+            return np.nan
+        return mantissa / 10.0 ** decimals
+else:
+    _parse_plain = None
+
+# pyarrow.compute 的正規表示式核心以 C++/re2 實作，
+# 清理大張工作表時比 pandas 的字串運算快數倍；未安裝時退回 pandas 路徑
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 # 設定 log 檔案名稱
 LOG_FILE = "error_log.txt"
 
+# 預先編譯清理規則用到的正規表示式，避免在熱迴圈中重複查表
+_RE_STAR = re.compile(r'^\*|\*$')
+_RE_EXTRACT = re.compile(r'\(([\d.]+)\)|@([\d.]+)|<\s*([\d.]+)|^([\d.]+)$')
+
 def log_error(message):
     """ 記錄錯誤到 log 檔案 """
     with open(LOG_FILE, "a", encoding="utf-8") as log:
         log.write(message + "\n")
 
-def clean_data(value):
+def _extract_number_arrow(arr, pattern):
+    """以 Arrow 的 re2 核心抽出數字群組（群組名稱須為 v）並轉成 float64"""
+    matches = pc.extract_regex(arr, pattern=pattern)
+    # .field() 不會保留「整列沒匹配」的 null 標記，要自己補回去
+    value = pc.if_else(pc.is_valid(matches), matches.field('v'),
+                       pa.scalar(None, pa.string()))
+    return pc.cast(value, pa.float64())
+
+def _clean_array_arrow(s):
+    """用 pyarrow.compute 核心執行與 clean_series 相同的清理規則"""
+    arr = pa.array(s, type=pa.string())
+    stripped = pc.replace_substring_regex(
+        pc.utf8_trim_whitespace(arr), pattern=r'^\*|\*$', replacement='')
+
+    is_zero = pc.is_in(pc.utf8_upper(stripped),
+                       value_set=pa.array(['-', '—', 'ND', 'N.A.']))
+
+    # 數字模式須包含 .5 這類開頭是小數點的寫法，與 pandas 路徑的
+    # [\d.]+ 及 _parse_plain 的結果一致
+    extracted = pc.coalesce(
+        _extract_number_arrow(stripped, r'\((?P<v>\d+\.?\d*|\.\d+)\)'),
+        _extract_number_arrow(stripped, r'@(?P<v>\d+\.?\d*|\.\d+)'),
+        pc.divide(_extract_number_arrow(stripped, r'<\s*(?P<v>\d+\.?\d*|\.\d+)'), 2.0),
+        _extract_number_arrow(stripped, r'^(?P<v>\d+\.?\d*|\.\d+)$'))
+    result = pc.if_else(is_zero, pa.scalar(0.0), extracted)
+    return result.to_numpy(zero_copy_only=False)
+
+def _clean_array_pandas(s):
+    """用 pandas 的 C 層字串運算執行清理規則，回傳 float64 陣列"""
+    stripped = s.str.strip().str.replace(_RE_STAR, '', regex=True)
+
+    # '-'、'—'、'ND'、'N.A.' 一律視為 0
+    is_zero = stripped.isin(['-', '—']) | stripped.str.upper().isin(['ND', 'N.A.'])
+
+    # 一次抽出四種數字格式：括號內、@ 後面、< 後面、純數字
+    groups = stripped.str.extract(_RE_EXTRACT)
+    paren = pd.to_numeric(groups[0], errors='coerce')
+    at = pd.to_numeric(groups[1], errors='coerce')
+    less_than = pd.to_numeric(groups[2], errors='coerce') / 2
+    plain = pd.to_numeric(groups[3], errors='coerce')
+    extracted = paren.combine_first(at).combine_first(less_than).combine_first(plain)
+
+    return np.where(is_zero.fillna(False).to_numpy(dtype=bool),
+                    0.0, extracted.to_numpy(dtype=float))
+
+def clean_series(s):
     """
-    清理數據：
-      - 若數據不是字串則直接回傳
-      - 移除前後空白
-      - 移除開頭或結尾的 '*' 字元
-      - 如果數據為 '-' 或 '—' 則回傳 0
+    一次清理整個量測欄位，全部使用向量化運算
+    （有 pyarrow 時改走更快的 Arrow 核心），
+    避免逐格呼叫 Python 函式；無法解析的值會變成 NaN。
+    規則：
+      - 移除前後空白與開頭/結尾的 '*' 字元
+      - '-'、'—'、'ND'（不分大小寫）、'N.A.' 一律視為 0
       - 如果數據包含括號 ()，則取括號內的數字
       - 如果數據包含 '@'，則取 '@' 後面的數字
       - 如果數據包含 '<'，則取 '<' 後面的數字並除以 2
-      - 如果數據為 "ND"（不分大小寫），則回傳 0
-      - 嘗試將數據轉為數字，轉換失敗則保留原值
     """
-    if not isinstance(value, str):
-        return value
-    value = value.strip()
-    
-    # 移除數據開頭或結尾的 '*' 字元
-    value = re.sub(r'^\*|\*$', '', value)
-    
-    # 如果數據為 '-' 或 '—' 則回傳 0
-    if value in ['-', '—']:
-        return 0
-
-    # 如果數據包含括號 ()，則取括號內的數字
-    if "(" in value and ")" in value:
-        m = re.search(r'\(([\d.]+)\)', value)
-        if m:
-            try:
-                return float(m.group(1))
-            except:
-                pass
-
-    # 如果數據包含 '@'，則取 @ 後面的數字
-    if "@" in value:
-        m = re.search(r'@([\d.]+)', value)
-        if m:
-            try:
-                return float(m.group(1))
-            except:
-                pass
-
-    # 如果數據包含 '<'，則取 '<' 後面的數字並除以 2
-    if "<" in value:
-        m = re.search(r'<\s*([\d.]+)', value)
-        if m:
-            try:
-                return float(m.group(1)) / 2
-            except:
-                pass
-
-    # 如果數據為 "ND"（不分大小寫），則回傳 0
-    if value.upper() == "ND" or value == "N.A.":
-        return 0
-
-    # 嘗試轉換成數字
+    # 非字串欄位（例如日期欄）不需清理，直接回傳
+    if not (s.dtype == object or pd.api.types.is_string_dtype(s)):
+        return s
+    s = s.astype("string")
+
+    if pa is not None:
+        return pd.Series(_clean_array_arrow(s), index=s.index)
+
+    if _parse_plain is not None:
+        # 最常見的情況是乾淨的數字字串：先走 numba 編譯的快速解析，
+        # 含特殊字元（*、(、@、<、- 等）而解析失敗的列才跑完整規則
+        result = np.fromiter(
+            (_parse_plain(v) if isinstance(v, str) else np.nan for v in s),
+            dtype=float, count=len(s))
+        needs_rules = np.isnan(result)
+        if needs_rules.any():
+            result[needs_rules] = _clean_array_pandas(s[needs_rules])
+        return pd.Series(result, index=s.index)
+
+    return pd.Series(_clean_array_pandas(s), index=s.index)
+
+def write_csv(df, output_file):
+    """
+    輸出 CSV，utf-8-sig（BOM）以利 Excel 正確顯示中文。
+    有 pyarrow 時改用其多執行緒的 C++ 寫入器，BOM 自行補在檔頭。
+    """
+    if pa is None:
+        df.to_csv(output_file, index=False, encoding="utf-8-sig")
+        return
+
     try:
-        return float(value)
-    except ValueError:
-        return value
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 混型欄位（例如日期中夾雜文字的採樣時間）無法轉成 Arrow 表，
+        # 退回 pandas 寫出
+        df.to_csv(output_file, index=False, encoding="utf-8-sig")
+        return
+    for i, field in enumerate(table.schema):
+        # 整欄都是午夜的時間欄只輸出日期，與 pandas to_csv 的格式一致
+        if pa.types.is_timestamp(field.type):
+            column = table.column(i)
+            all_midnight = pc.all(
+                pc.equal(column, pc.floor_temporal(column, unit="day"))).as_py()
+            if all_midnight:
+                table = table.set_column(i, field.name,
+                                         pc.cast(column, pa.date32()))
+            else:
+                # 其餘時間欄降到秒解析度再輸出，避免 Arrow 寫出
+                # pandas to_csv 不會有的微秒尾碼（…10:30:00.000000）
+                table = table.set_column(
+                    i, field.name,
+                    pc.cast(column, pa.timestamp("s"), safe=False))
+    with open(output_file, "wb") as f:
+        f.write(b"\xef\xbb\xbf")
+        pacsv.write_csv(table, f,
+                        write_options=pacsv.WriteOptions(quoting_style="needed"))
 
 def process_sheets(input_file, sheet_names):
     """
@@ -78,12 +178,20 @@ def process_sheets(input_file, sheet_names):
     """
     required_headers = ["採樣時間", "懸浮固體", "氨氮", "生化需氧量", "總磷"]
 
+    try:
+        # 一次讀入整本活頁簿（sheet_name=None 回傳 {工作表名稱: DataFrame}），
+        # 避免每個工作表都重新解析一次共用字串與樣式表
+        sheets = pd.read_excel(input_file, engine="openpyxl", sheet_name=None)
+    except Exception as e:
+        error_message = f"讀取檔案 {input_file} 時發生錯誤: {e}\n{traceback.format_exc()}"
+        print(error_message)
+        log_error(error_message)
+        return
+
     for sheet_name in sheet_names:
-        try:
-            # 讀取 Excel 檔案中的指定工作表，改用 openpyxl 引擎
-            df = pd.read_excel(input_file, engine="openpyxl", sheet_name=sheet_name)
-        except Exception as e:
-            error_message = f"讀取工作表 {sheet_name} 時發生錯誤: {e}\n{traceback.format_exc()}"
+        df = sheets.get(sheet_name)
+        if df is None:
+            error_message = f"找不到工作表 {sheet_name}，跳過處理"
             print(error_message)
             log_error(error_message)
             continue
@@ -103,38 +211,37 @@ def process_sheets(input_file, sheet_names):
             log_error(error_message)
             continue
 
-        # 逐列檢查數據格式，找出可能導致錯誤的值
-        problematic_rows = []
-        for index, row in df.iterrows():
-            for col in available_columns:
-                try:
-                    _ = clean_data(row[col])
-                except Exception as e:
-                    problematic_rows.append(row)
-                    error_message = f"數據錯誤: 工作表 {sheet_name}，列 {index+1}，欄位 {col}，值: {row[col]}，錯誤: {e}"
-                    print(error_message)
-                    log_error(error_message)
-
-        # 如果有問題數據，存成 CSV 方便檢查
-        if problematic_rows:
-            error_df = pd.DataFrame(problematic_rows)
-            error_file = f"error_data_{sheet_name}.csv"
-            error_df.to_csv(error_file, index=False, encoding="utf-8-sig")
-            log_error(f"已儲存問題數據至 {error_file}")
-
         # 僅保留所需欄位，並在第一欄新增 "來源工作表"
         df_filtered = df[available_columns].copy()
         df_filtered.insert(0, "來源工作表", sheet_name)
 
-        # 對每個欄位的數據進行清理處理
-        for col in available_columns:
-            df_filtered[col] = df_filtered[col].apply(clean_data)
+        # 只清理量測欄位：採樣時間常混有文字格（object dtype），
+        # 字串化後會被數字抽取規則整欄清成 NaN，必須原樣保留
+        measurement_columns = [col for col in available_columns if col != "採樣時間"]
+
+        # 對每個量測欄位的數據進行清理處理（逐欄向量化，而非逐格呼叫）
+        df_filtered[measurement_columns] = df_filtered[measurement_columns].apply(clean_series)
+
+        # 清理後檢查問題數據：原本有值、清理後卻變成 NaN 的格子即為無法解析
+        bad_index = df.index[[False] * len(df)]
+        for col in measurement_columns:
+            bad_mask = df_filtered[col].isna() & df[col].notna()
+            for index, raw in df.loc[bad_mask, col].items():
+                error_message = f"數據錯誤: 工作表 {sheet_name}，列 {index+1}，欄位 {col}，值: {raw}"
+                print(error_message)
+                log_error(error_message)
+            bad_index = bad_index.union(df.index[bad_mask])
+
+        # 如果有問題數據，存成 CSV 方便檢查
+        if len(bad_index):
+            error_file = f"error_data_{sheet_name}.csv"
+            df.loc[bad_index].to_csv(error_file, index=False, encoding="utf-8-sig")
+            log_error(f"已儲存問題數據至 {error_file}")
 
         # 設定輸出檔案名稱
         output_file = f"{sheet_name}.csv"
 
-        # 輸出 CSV，設定 utf-8-sig 以利 Excel 正確顯示中文
-        df_filtered.to_csv(output_file, index=False, encoding="utf-8-sig")
+        write_csv(df_filtered, output_file)
         print(f"資料已成功匯出至 {output_file}")
 
 if __name__ == "__main__":